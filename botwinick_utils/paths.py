@@ -2,13 +2,16 @@
 # title: miscellaneous path utilities for python 2/3
 # license: 3-clause BSD
 
-import codecs
-import errno
+import logging
+import mmap
 import subprocess
 
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from hashlib import sha1
-from os import environ, listdir, makedirs as _makedirs, path as osp, unlink, utime
-from shutil import copy
+from os import (O_CREAT, O_RDONLY, O_WRONLY, close, cpu_count, environ, fstat, makedirs as _makedirs,
+                open as _os_open, path as osp, truncate as _truncate, unlink, utime)
+from shutil import SameFileError, copy
 
 from .platforms import operating_system
 
@@ -19,6 +22,36 @@ except ImportError:  # TODO: evaluate how we want to handle Windows compatibilit
     def _symlink(*args, **kwargs):
         raise OSError()
 
+# operating system identity doesn't change within a process, so resolve it (and native copy support) once
+_OS = operating_system()
+_LINUX_CP_ARGV_PREFIX = ["/bin/cp", "--reflink=auto"]
+if _OS == "windows":
+    from .platforms.windows import copy_file as _native_copy_file
+elif _OS == "linux":
+    from .platforms.linux import copy_file as _native_copy_file
+else:
+    _native_copy_file = None
+
+try:
+    from hashlib import file_digest as _file_digest  # python 3.11+
+except ImportError:
+    _file_digest = None
+
+# hashlib resolves sha1 to the OpenSSL constructor when available; OpenSSL dispatches to SHA-NI (x86) or the
+# ARMv8 SHA extensions when the CPU supports them--but only gets to do so efficiently for large single updates
+SHA1_OPENSSL = getattr(sha1, '__name__', '').startswith('openssl_')
+
+_MADV_SEQUENTIAL = getattr(mmap, 'MADV_SEQUENTIAL', None)  # not available on Windows
+
+# files at least this large are hashed via mmap (below this, mmap setup cost dominates)
+MMAP_THRESHOLD = 10 * 1024 * 1024
+
+# below this size, single-threaded BLAKE3 is faster than spinning up its thread pool
+BLAKE3_THREADING_THRESHOLD = 128 * 1024
+
+# files at least this large bypass the system cache when copied natively on Windows
+NO_BUFFERING_THRESHOLD = 256 * 1024 * 1024
+
 
 def path_to_package(path_name):
     return osp.normpath(path_name).replace(osp.sep, '.')
@@ -28,25 +61,24 @@ def package_to_path(package_name):
     return osp.normpath(package_name.replace('.', osp.sep))
 
 
-# noinspection PyDefaultArgument
-def _path_split(p, rest=list()):
-    h, t = osp.split(p)
-    if len(h) < 1:
-        return [t] + rest
-    if len(t) < 1:
-        return [h] + rest
-    return _path_split(h, [t] + rest)
+def _path_split(p):
+    drive, tail = osp.splitdrive(osp.normpath(p))
+    parts = [c for c in tail.split(osp.sep) if c and c != osp.curdir]  # normpath('') is '.'; drop it
+    if tail.startswith(osp.sep):  # keep the root (and drive) as the leading component for absolute paths
+        return [drive + osp.sep] + parts
+    return [drive] + parts if drive else parts
 
 
-# noinspection PyDefaultArgument
-def _common_path(l1, l2, common=list()):
-    if len(l1) == 0 or len(l2) == 0:  # we ran out of path parts in either l1 or l2
-        return common, l1, l2
-    if l1[0] != l2[0]:  # we must be done because the first parts of either path don't match
-        return common, l1, l2
-    return _common_path(l1[1:], l2[1:], common + [l1[0]])  # we've found a common element, recursive call minus common
+def _common_path(l1, l2):
+    i = 0
+    for a, b in zip(l1, l2):
+        if a != b:  # we must be done because the parts of either path don't match
+            break
+        i += 1
+    return l1[:i], l1[i:], l2[i:]
 
 
+@lru_cache(maxsize=1024)  # pure function of its (immutable) string inputs; batch callers often repeat pairs
 def relative_path(p1, p2):
     """
     Return the string that should be prepended to files in p1 such that they would be located in p2? I find
@@ -60,14 +92,11 @@ def relative_path(p1, p2):
     :rtype: str
     """
     common, l1, l2 = _common_path(_path_split(p1), _path_split(p2))
-    path_parts = []
     effective_length = len(l1) - l1.count(osp.curdir) - l1.count('')
-    # create a list of '../' * number of directories to traverse + left over path components
-    if effective_length > 0:
-        path_parts += [(osp.pardir + osp.sep) * effective_length]
-    if len(l2) > 0:
-        path_parts += l2
-    return osp.join(*path_parts) if path_parts else ''  # TODO: evaluate path parts empty check...
+    if l2 and l2[0].endswith(osp.sep):  # l2 kept its root (p2 absolute, p1 not); the root wins as with osp.join
+        return l2[0] + osp.sep.join(l2[1:])
+    # '../' * number of directories to traverse + left over path components (already split, so no need for osp.join)
+    return (osp.pardir + osp.sep) * effective_length + osp.sep.join(l2)
 
 
 def symlink(src, target, force=True, relative=True):
@@ -86,10 +115,12 @@ def symlink(src, target, force=True, relative=True):
     if osp.realpath(src) == osp.realpath(target):
         return True  # return True if the link is already in place / the same inode/entity is read for both files right now
 
-    path_parts = osp.split(src)
-    init_path = path_parts[0] if not relative else relative_path(osp.dirname(target), path_parts[0])
-
-    effective_src = osp.join(init_path, path_parts[1])
+    effective_src = src
+    if relative:
+        try:
+            effective_src = osp.relpath(src, osp.dirname(target) or osp.curdir)
+        except ValueError:  # no relative path possible (e.g. different drives on Windows); link to src as given
+            pass
 
     if force:
         try:
@@ -115,54 +146,236 @@ def cascade_search(origin_dir, file_target, env_target=None):
     :param file_target: the file to search for
     :param env_target: the environment variable to fall back on
     """
-    # TODO: convert to use os.walk? instead of being recursive?
-    for f in listdir(origin_dir):
-        if f == file_target:
-            with open(osp.abspath(osp.join(origin_dir, file_target))) as d:
+    while True:
+        # just try to open the candidate: a hit costs one open (no directory listing and no separate stat)
+        candidate = osp.abspath(osp.join(origin_dir, file_target))
+        try:
+            d = open(candidate)
+        except (FileNotFoundError, NotADirectoryError, IsADirectoryError):
+            pass
+        except PermissionError:
+            # Windows raises this for directories; also raised for an unsearchable directory. only a real but
+            # unreadable file is an error (matching the previous osp.isfile check); otherwise keep walking up
+            if osp.isfile(candidate):
+                raise
+        else:
+            with d:
                 return d.readline().strip(), origin_dir
-    parent_dir = osp.abspath(osp.join(origin_dir, osp.pardir))
-    if parent_dir != origin_dir:
-        return cascade_search(parent_dir, file_target, env_target)
+        parent_dir = osp.abspath(osp.join(origin_dir, osp.pardir))
+        if parent_dir == origin_dir:
+            break
+        origin_dir = parent_dir
     return (environ[env_target], None) if env_target is not None and env_target in environ else (None, None)
 
 
 def touch(path, truncate=False, create_directories=False):
     # path = osp.abspath(path)
     if create_directories:
-        base_dir = osp.dirname(path)
-        if not osp.exists(base_dir):
-            makedirs(base_dir)
-    with open(path, 'a' if not truncate else 'w'):
-        utime(path, None)
+        makedirs(osp.dirname(path))  # makedirs already ignores existing directories
+    if truncate:
+        try:
+            _truncate(path, 0)  # existing file: truncate by path, no open/close needed
+            utime(path, None)
+            return path
+        except FileNotFoundError:
+            pass  # doesn't exist yet, so there's nothing to truncate; just create it
+    # create-or-open without allocating a python file object (same as touch(1): open(O_CREAT) + close + utimensat)
+    close(_os_open(path, O_WRONLY | O_CREAT, 0o666))
+    utime(path, None)
     return path
 
 
 def write(path, content, encoding='utf8'):
-    with codecs.open(path, 'w', encoding) as f:
+    with open(path, 'w', encoding=encoding, newline='') as f:  # newline='' to write content as-is (like codecs.open)
         f.write(content)
 
 
 def append(path, content, encoding='utf8'):
-    with codecs.open(path, 'a', encoding) as f:
+    with open(path, 'a', encoding=encoding, newline='') as f:
         f.write(content)
 
 
-def hash_file_sha1(file_target, buffer_size=262144):
+def sha1_backend():
+    """
+    Describe the SHA1 implementation used by `hash_file_sha1`, i.e. whether hashlib is backed by OpenSSL and whether
+    the CPU advertises SHA instructions (`sha_ni` on x86 or `sha1` on ARMv8; Linux only).
+
+    :return: description such as 'OpenSSL 3.0.2 15 Mar 2022 (sha_ni)'
+    :rtype: str
+    """
+    if SHA1_OPENSSL:
+        from ssl import OPENSSL_VERSION
+        backend = OPENSSL_VERSION
+    else:
+        backend = 'builtin'
+    if _OS == 'linux':
+        from .platforms.linux import cpu_features
+        hw = sorted(cpu_features() & {'sha_ni', 'sha1'})
+        if hw:
+            backend = '%s (%s)' % (backend, ', '.join(hw))
+    logging.getLogger(__name__).debug('hashlib sha1 backend: %s', backend)
+    return backend
+
+
+def hash_file_sha1(file_target, buffer_size=None):
+    """
+    Compute the SHA1 hex digest of a file.
+
+    Files of at least `MMAP_THRESHOLD` bytes are memory-mapped and fed to the hash in a single update (falling back
+    to reading the file if it can't be memory-mapped, e.g. on FUSE mounts using direct_io). Smaller files are read
+    in chunks of `buffer_size`; if `buffer_size` isn't given, `hashlib.file_digest` is used instead when available
+    (python 3.11+).
+
+    If a SHA1 digest specifically is not required (e.g. content addressing or cache keys), prefer `hash_file_blake3`
+    which is substantially faster on multi-core machines.
+
+    :param file_target: the file to hash
+    :param buffer_size: read size when reading the file in chunks (default 4 MiB; keep a multiple of the 4 KiB page
+    size); not used for memory-mapped files
+    :return: SHA1 hex digest
+    :rtype: str
+    """
     hash_alg = sha1()
     with open(file_target, 'rb') as f:
-        buf = f.read(buffer_size)
-        while len(buf) > 0:
+        if fstat(f.fileno()).st_size >= MMAP_THRESHOLD:
+            try:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (OSError, ValueError):  # e.g. ENODEV for FUSE direct_io; just read the file instead
+                mm = None
+            if mm is not None:
+                with mm:
+                    if _MADV_SEQUENTIAL is not None:
+                        mm.madvise(_MADV_SEQUENTIAL)  # hint kernel readahead
+                    hash_alg.update(mm)  # single update over the whole buffer; no python-level chunking
+                return hash_alg.hexdigest()
+        if buffer_size is None:
+            if _file_digest is not None:
+                return _file_digest(f, sha1).hexdigest()
+            buffer_size = 1 << 22
+        while buf := f.read(buffer_size):
             hash_alg.update(buf)
-            buf = f.read(buffer_size)
     return hash_alg.hexdigest()
 
 
-def makedirs(path):
+def _io_workers(workers=None):
+    # I/O-bound batches benefit from more outstanding requests than there are cores
+    return workers or min(32, (cpu_count() or 1) * 2)
+
+
+def hash_files_sha1(file_targets, workers=None):
+    """
+    Compute SHA1 hex digests for multiple files concurrently (hashing and file reads release the GIL).
+
+    :param file_targets: iterable of files to hash
+    :param workers: number of worker threads (default is 2x cpu count, capped at 32)
+    :return: dict mapping each file to its SHA1 hex digest
+    :rtype: dict
+    """
+    file_targets = list(file_targets)
+    with ThreadPoolExecutor(max_workers=_io_workers(workers)) as ex:
+        return dict(zip(file_targets, ex.map(hash_file_sha1, file_targets)))
+
+
+def hash_files_sha1_uring(file_targets, depth=16, buffer_size=262144):
+    """
+    Compute SHA1 hex digests for multiple files using io_uring (Linux only). Up to `depth` files are read
+    concurrently (one outstanding sequential read per file so each hash is updated in order) and hashing of
+    completed reads overlaps with the reads still in flight.
+
+    Falls back to `hash_files_sha1` if not on Linux, for single-file batches (nothing to overlap), if the `liburing`
+    package is not available, or if an io_uring instance can't be created.
+
+    NOTE: requires the `liburing` package (2025+ API)
+
+    :param file_targets: iterable of files to hash
+    :param depth: maximum number of files being read concurrently (io_uring queue depth)
+    :param buffer_size: size of each read
+    :return: dict mapping each file to its SHA1 hex digest
+    :rtype: dict
+    """
+    file_targets = list(file_targets)
+    if _OS != 'linux' or len(file_targets) < 2:
+        return hash_files_sha1(file_targets)
     try:
-        _makedirs(osp.normpath(path))
-    except OSError as e:
-        if e.errno != errno.EEXIST:
-            raise e
+        from liburing import (Cqe, Ring, io_uring_cqe_seen, io_uring_get_sqe, io_uring_prep_read, io_uring_queue_exit,
+                              io_uring_queue_init, io_uring_sqe_set_data64, io_uring_submit, io_uring_wait_cqe)
+    except ImportError:
+        return hash_files_sha1(file_targets)
+
+    ring = Ring()
+    try:
+        io_uring_queue_init(depth, ring)
+    except OSError:  # e.g. io_uring disabled by kernel/container policy
+        return hash_files_sha1(file_targets)
+
+    cqe = Cqe()
+    remaining = iter(file_targets)
+    active = {}  # slot -> [file_target, fd, offset, buffer, hash_alg]
+    results = {}
+
+    def _queue_read(slot):
+        _, fd, offset, buf, _ = active[slot]
+        sqe = io_uring_get_sqe(ring)
+        io_uring_prep_read(sqe, fd, buf, offset)
+        io_uring_sqe_set_data64(sqe, slot)
+
+    def _start_next(slot):
+        for target in remaining:  # takes at most one file
+            active[slot] = [target, _os_open(target, O_RDONLY), 0, bytearray(buffer_size), sha1()]
+            _queue_read(slot)
+            return
+
+    try:
+        for i in range(min(depth, len(file_targets))):
+            _start_next(i)
+        while active:
+            io_uring_submit(ring)
+            io_uring_wait_cqe(ring, cqe)
+            entry = cqe[0]
+            try:
+                slot = entry.user_data
+                n = entry.res  # raises OSError if the read failed
+            finally:
+                io_uring_cqe_seen(ring, entry)
+            state = active[slot]
+            if n > 0:
+                state[4].update(memoryview(state[3])[:n])
+                state[2] += n
+                _queue_read(slot)
+            else:  # end of file
+                del active[slot]
+                close(state[1])
+                results[state[0]] = state[4].hexdigest()
+                _start_next(slot)
+    finally:
+        for state in active.values():
+            close(state[1])
+        io_uring_queue_exit(ring)
+    return {target: results[target] for target in file_targets}
+
+
+def hash_file_blake3(file_target):
+    """
+    Compute the BLAKE3 hex digest of a file. Files of at least `BLAKE3_THREADING_THRESHOLD` bytes are memory-mapped
+    and hashed using multiple threads (BLAKE3's tree structure allows parallel hashing).
+
+    NOTE: requires the `blake3` package
+
+    :param file_target: the file to hash
+    :return: BLAKE3 hex digest
+    :rtype: str
+    """
+    import blake3
+
+    with open(file_target, 'rb') as f:
+        if fstat(f.fileno()).st_size < BLAKE3_THREADING_THRESHOLD:  # also avoids mmap of empty files
+            return blake3.blake3(f.read()).hexdigest()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return blake3.blake3(mm, max_threads=blake3.blake3.AUTO).hexdigest()
+
+
+def makedirs(path):
+    _makedirs(osp.normpath(path), exist_ok=True)
 
 
 def native_copy(src, dst, raise_on_error=False):
@@ -175,22 +388,44 @@ def native_copy(src, dst, raise_on_error=False):
 
     :param src: source file
     :param dst: destination file
-    :param raise_on_error: raise an error if native copy results in non-zero exit code (alternative is to fall back to `shutil.copy`)
+    :param raise_on_error: raise an error if native copy fails (alternative is to fall back to `shutil.copy`)
     """
-    system = operating_system()
     try:
-        if system == "windows":
-            # seems like shell is needed to make this work? might be fixable, but for now, this is the easiest solution
-            dev_null = subprocess.DEVNULL
-            subprocess.run(["xcopy", "/Y", '/Z', src, dst], check=True, shell=True, stdout=dev_null, stderr=dev_null)
-        elif system == "linux":
-            subprocess.run(["/bin/cp", "--reflink=auto", src, dst], check=True)
+        if _OS == "windows":
+            if osp.isdir(dst):  # CopyFileExW needs a file path; match shutil.copy semantics for directory targets
+                dst = osp.join(dst, osp.basename(src))
+            _native_copy_file(src, dst, no_buffering=osp.getsize(src) >= NO_BUFFERING_THRESHOLD)
+        elif _OS == "linux":
+            if osp.isdir(dst):  # copy_file_range needs a file path; match cp semantics for directory targets
+                dst = osp.join(dst, osp.basename(src))
+            try:
+                _native_copy_file(src, dst)
+            except SameFileError:  # nothing was touched; don't bother with cp (shutil.copy below raises the same)
+                raise
+            except OSError:  # e.g. unsupported by the kernel/filesystem; let cp sort it out
+                subprocess.run(_LINUX_CP_ARGV_PREFIX + [src, dst], check=True)
         else:  # fall back option if we're not on windows or linux
             copy(src, dst)
-    except (subprocess.CalledProcessError, FileNotFoundError) as e:
+    except (subprocess.CalledProcessError, OSError) as e:
         if raise_on_error:  # enable developer to select whether they want to know if it fails or not
             raise e
         # but by default let's just try to make sure the file gets copied...
         copy(src, dst)
 
     return
+
+
+def native_copy_many(pairs, raise_on_error=False, workers=None):
+    """
+    Copies multiple files concurrently using `native_copy`.
+
+    :param pairs: iterable of (src, dst) tuples
+    :param raise_on_error: see `native_copy`
+    :param workers: number of worker threads (default is 2x cpu count, capped at 32)
+    """
+    pairs = list(pairs)
+    with ThreadPoolExecutor(max_workers=_io_workers(workers)) as ex:
+        # consume results so that any errors are raised to the caller
+        for _ in ex.map(lambda pair: native_copy(pair[0], pair[1], raise_on_error), pairs):
+            pass
+    return
@@ -1,13 +1,16 @@
 import logging
 import os
 import threading
-from typing import Callable, Any
-from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Any, Literal
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
 _logger = None  # type: logging.Logger|None
 _job_executor = None  # type: JobExecutorEngine|None
+_cpu_job_executor = None  # type: JobExecutorEngine|None
 
 DEFAULT_BG_THREADS = os.getenv('ENGINE_BACKGROUND_THREADS', 4)
+DEFAULT_BG_PROCESSES = int(os.getenv('ENGINE_BACKGROUND_PROCESSES', 0)) or None  # None -> number of cpus
+DEFAULT_MAX_QUEUE_DEPTH = int(os.getenv('ENGINE_BACKGROUND_MAX_QUEUE_DEPTH', 0)) or None  # None -> unbounded
 DEFAULT_SHUTDOWN_WAIT = False
 DEFAULT_SHUTDOWN_CANCEL = True
 
@@ -26,16 +29,45 @@ def _get_exec():
     return _job_executor
 
 
+def _get_cpu_exec():
+    global _cpu_job_executor
+    if _cpu_job_executor is None:
+        _cpu_job_executor = JobExecutorEngine(max_workers=DEFAULT_BG_PROCESSES, name='engine cpu background',
+                                              pool_kind='process')
+    return _cpu_job_executor
+
+
 class JobExecutorEngine(object):
+    """
+    Background job executor backed by a thread pool (default; best for I/O bound jobs) or a process pool
+    (`pool_kind='process'`; for CPU bound python code that would otherwise be serialized by the GIL).
+
+    For process pools, jobs (fn, args, and kwargs) must be pickleable. Unique job_id reservations are still
+    tracked in this process but are cleared when the job completes for both "pre" and "post" style jobs (the start of
+    a job in a worker process isn't observable from here).
+
+    If `max_queue_depth` is given, at most that many jobs may be outstanding (queued or running) at once; further
+    submissions block until a job finishes (`block_when_full=True`) or are rejected (submit returns False). This caps
+    the memory held by pending futures and their arguments when a producer floods the executor.
+    """
+
     def __init__(self, max_workers: int = DEFAULT_BG_THREADS, name='engine background',
-                 thread_name_prefix='bg-engine-thread', log_collisions_as_info=True):
-        _get_logger().info('initializing %s thread pool executor with %s workers', name, max_workers)
+                 thread_name_prefix='bg-engine-thread', log_collisions_as_info=True,
+                 pool_kind: Literal['thread', 'process'] = 'thread', max_queue_depth: int = DEFAULT_MAX_QUEUE_DEPTH,
+                 block_when_full=True):
+        _get_logger().info('initializing %s %s pool executor with %s workers', name, pool_kind, max_workers)
         self._name = name
-        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=thread_name_prefix)
+        self._pool_kind = pool_kind
+        self._processes = pool_kind == 'process'
+        if self._processes:
+            self._executor = ProcessPoolExecutor(max_workers=max_workers)
+        else:
+            self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=thread_name_prefix)
         # TODO: also consider using daemon threads if we don't care about interrupting the jobs on exit...
-        self._lock = threading.Lock()
-        self._job_ids = set()
+        self._job_ids = {}  # type: dict[str, object]  # job_id -> reservation token; single dict ops are atomic
         self._log_collisions_as_info = log_collisions_as_info
+        self._slots = threading.BoundedSemaphore(max_queue_depth) if max_queue_depth else None
+        self._block_when_full = block_when_full
 
     # TODO: add progress reporting capabilities from rostra to jobs to enable holistic progress reporting
 
@@ -82,10 +114,13 @@ class JobExecutorEngine(object):
         :param kwargs: keyword arguments for the function
         :return: boolean True if queued
         """
-        return bool(self._executor.submit(fn, *args, **kwargs))
+        return self._submit(fn, *args, **kwargs) is not None
 
     @property
     def queue_length(self):
+        if self._processes:  # process pools track submitted (queued + running) work items instead
+            # noinspection PyProtectedMember,PyUnresolvedReferences
+            return len(self._executor._pending_work_items)
         # noinspection PyProtectedMember
         return self._executor._work_queue.qsize()
 
@@ -96,21 +131,53 @@ class JobExecutorEngine(object):
         return list(self._job_ids)
 
     def _submit_job(self, job_id: str, run_fn, fn: Callable[..., Any], *args, **kwargs):
-        with self._lock:
-            # check for conflicting job
-            if job_id in self._job_ids:
-                log_fn = _get_logger().info if self._log_collisions_as_info else _get_logger().debug
-                log_fn("Job with ID %s is already in the queue. Ignoring duplicate.", job_id)
-                return False
-
-            # submit job
-            self._job_ids.add(job_id)
-            self._executor.submit(run_fn, job_id, fn, *args, **kwargs)
-            return True
+        # reserve job_id; setdefault is atomic (under the GIL) so only one submitter can get its token in
+        token = object()
+        if self._job_ids.setdefault(job_id, token) is not token:
+            log_fn = _get_logger().info if self._log_collisions_as_info else _get_logger().debug
+            log_fn("Job with ID %s is already in the queue. Ignoring duplicate.", job_id)
+            return False
+
+        # submit job (outside of any lock of our own; the executor's work queue has its own locking)
+        try:
+            if self._processes:  # bound run_fn can't be sent to a worker process, so clean up from here when done
+                future = self._submit(fn, *args, **kwargs)
+                if future is not None:
+                    future.add_done_callback(lambda _: self._job_ids.pop(job_id, None))
+            else:
+                future = self._submit(run_fn, job_id, fn, *args, **kwargs)
+        except BaseException:
+            self._job_ids.pop(job_id, None)  # release the reservation if the job could not be queued
+            raise
+        if future is None:  # rejected because the queue is full
+            self._job_ids.pop(job_id, None)
+            return False
+        return True
+
+    def _submit(self, fn: Callable[..., Any], *args, **kwargs):
+        """
+        Submit to the underlying executor, respecting `max_queue_depth`.
+
+        :return: the future, or None if the job was rejected because the queue is full
+        """
+        if self._slots is not None and not self._slots.acquire(blocking=self._block_when_full):
+            _get_logger().warning("Queue for %s %s pool executor is full. Rejecting job.", self._name, self._pool_kind)
+            return None
+        try:
+            future = self._executor.submit(fn, *args, **kwargs)
+        except BaseException:
+            if self._slots is not None:
+                self._slots.release()
+            raise
+        if self._slots is not None:
+            future.add_done_callback(self._release_slot)
+        return future
+
+    def _release_slot(self, _future):
+        self._slots.release()
 
     def _run_pre_job(self, job_id: str, fn: Callable[..., Any], *args, **kwargs):
-        with self._lock:
-            self._job_ids.remove(job_id)  # Clean up job_id before starting for (pre) style job
+        self._job_ids.pop(job_id, None)  # Clean up job_id before starting for (pre) style job
 
         fn(*args, **kwargs)  # Run the actual job
         return
@@ -119,8 +186,7 @@ class JobExecutorEngine(object):
         try:
             fn(*args, **kwargs)  # Run the actual job
         finally:
-            with self._lock:
-                self._job_ids.remove(job_id)  # Clean up job_id when done for (post) style job
+            self._job_ids.pop(job_id, None)  # Clean up job_id when done for (post) style job
         return
 
     def shutdown(self, wait: bool = DEFAULT_SHUTDOWN_WAIT, cancel_pending: bool = DEFAULT_SHUTDOWN_CANCEL):
@@ -130,7 +196,7 @@ class JobExecutorEngine(object):
         :param wait: whether to join/wait for shutdown completion
         :param cancel_pending: whether to cancel pending activities
         """
-        _get_logger().info('Shutting down %s thread pool executor', self._name)
+        _get_logger().info('Shutting down %s %s pool executor', self._name, self._pool_kind)
         return self._executor.shutdown(wait=wait, cancel_futures=cancel_pending)
 
 
@@ -138,6 +204,19 @@ def bg_run(fn, *args, **kwargs):
     return _get_exec().submit_job(fn, *args, **kwargs)
 
 
+def bg_run_cpu(fn, *args, **kwargs):
+    """
+    Run a given CPU bound task (fn, *args, **kwargs) via the default background process pool executor (created
+    on first use, separate from the thread pool used by `bg_run`). Note that fn, args, and kwargs must be pickleable.
+
+    :param fn: the function to execute
+    :param args: arguments for the function
+    :param kwargs: keyword arguments for the function
+    :return: boolean True if queued
+    """
+    return _get_cpu_exec().submit_job(fn, *args, **kwargs)
+
+
 # noinspection PyShadowingBuiltins
 def bg_run_unique_post(id, fn, *args, **kwargs):
     """
@@ -179,15 +258,16 @@ bg_run_unique = bg_run_unique_post
 
 def bg_exec_shutdown(wait: bool = DEFAULT_SHUTDOWN_WAIT, cancel_pending: bool = DEFAULT_SHUTDOWN_CANCEL):
     """
-    Call to trigger shutdown of the background thread pool executor if it has been initialized. It is
-    safe to call this function on termination even if the background thread pool executor was never
-    started.
+    Call to trigger shutdown of the background thread pool executor (and the background process pool
+    executor used by `bg_run_cpu`) if it has been initialized. It is safe to call this function on
+    termination even if the background executors were never started.
 
     :param wait: whether to join/wait for shutdown completion
     :param cancel_pending: whether to cancel pending activities
     :return:
     """
-    global _job_executor
-    if _job_executor is None:  # nothing to do if job executor was never initialized
-        return
-    return _job_executor.shutdown(wait=wait, cancel_pending=cancel_pending)
+    global _job_executor, _cpu_job_executor
+    if _cpu_job_executor is not None:  # nothing to do for executors that were never initialized
+        _cpu_job_executor.shutdown(wait=wait, cancel_pending=cancel_pending)
+    if _job_executor is not None:
+        _job_executor.shutdown(wait=wait, cancel_pending=cancel_pending)
@@ -1,8 +1,10 @@
 # author: Drew Botwinick, Botwinick Innovations
 # license: 3-clause BSD
 
+import errno
 import os
 import sys
+from shutil import SameFileError
 
 
 # region Daemonize (Linux)
@@ -126,3 +128,66 @@ def daemonize_linux(stdin='/dev/null', stdout='/dev/null', stderr=None, pid_file
 # Second fork - prevent you from accidentally reacquiring a controlling terminal.
 
 # endregion
+
+# region CPU Features (Linux)
+
+
+def cpu_features(cpuinfo_path='/proc/cpuinfo'):
+    """
+    Return the set of CPU feature flags reported by the kernel (the `flags` line on x86 or the `Features` line on
+    ARM). Returns an empty set if the information is not available.
+
+    :param cpuinfo_path: path to cpuinfo file
+    :return: set of feature flag strings
+    """
+    try:
+        with open(cpuinfo_path) as f:
+            for line in f:
+                key, sep, value = line.partition(':')
+                if sep and key.strip() in ('flags', 'Features'):
+                    return set(value.split())
+    except OSError:
+        pass
+    return set()
+
+# endregion
+
+# region File Copy (Linux)
+
+
+def copy_file(src, dst):
+    """
+    Copy a file in-kernel using copy_file_range(2); on filesystems that support it (e.g. btrfs, XFS) this may share
+    extents (reflink) with the source, equivalent to `cp --reflink=auto`. Overwrites dst if it already exists.
+    Permission bits of a newly created dst follow the source (subject to umask) as with `cp`.
+
+    :param src: source file
+    :param dst: destination file (not a directory)
+    :raises shutil.SameFileError: if src and dst are the same file (dst is left untouched)
+    :raises OSError: if copy_file_range isn't available (dst is left untouched), if the copy fails (e.g. EXDEV when
+    copying across filesystems on older kernels) or if nothing could be copied (e.g. /proc or /sys files that report
+    a size of 0); callers should fall back to another method
+    """
+    if not hasattr(os, 'copy_file_range'):  # only available when python was built against glibc 2.27+
+        raise OSError(errno.ENOSYS, 'os.copy_file_range is not available')
+    with open(src, 'rb') as s:
+        st = os.fstat(s.fileno())
+        fd = os.open(dst, os.O_WRONLY | os.O_CREAT, st.st_mode & 0o777)  # no O_TRUNC until we know dst isn't src
+        try:
+            if os.path.samestat(st, os.fstat(fd)):
+                raise SameFileError('%r and %r are the same file' % (src, dst))
+            os.ftruncate(fd, 0)
+            # don't trust st_size (pseudo files report 0); copy until the kernel reports end of file
+            block_size = max(st.st_size, 1 << 23)
+            copied = 0
+            while True:
+                n = os.copy_file_range(s.fileno(), fd, block_size)
+                if n == 0:
+                    break
+                copied += n
+            if copied == 0:  # empty or unsupported source; can't tell which, so let the caller use another method
+                raise OSError('copy_file_range copied nothing from %r' % src)
+        finally:
+            os.close(fd)
+
+# endregion
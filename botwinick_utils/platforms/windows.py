@@ -3,6 +3,8 @@
 import ctypes
 import sys
 
+COPY_FILE_NO_BUFFERING = 0x00001000
+
 
 def allocate_console():
     """
@@ -49,3 +51,18 @@ def redirect_std_streams_to_console():
     """
     sys.stdout = open_console_stream()
     sys.stderr = open_console_stream()
+
+
+def copy_file(src, dst, no_buffering=False):
+    """
+    Copy a file using the Windows CopyFileExW API (overwrites dst if it already exists).
+
+    :param src: source file
+    :param dst: destination file (not a directory)
+    :param no_buffering: bypass the system cache (COPY_FILE_NO_BUFFERING); recommended for very large files
+    :raises OSError: if the copy fails
+    """
+    flags = COPY_FILE_NO_BUFFERING if no_buffering else 0
+    if not ctypes.windll.kernel32.CopyFileExW(ctypes.c_wchar_p(str(src)), ctypes.c_wchar_p(str(dst)),
+                                              None, None, None, flags):
+        raise ctypes.WinError()
@@ -16,6 +16,10 @@ setuptools.setup(
     url="https://github.com/dbotwinick/botwinick_utils",
     packages=setuptools.find_packages(),
     install_requires=[],
+    extras_require={
+        'blake3': ['blake3'],
+        'uring': ['liburing'],
+    },
     classifiers=[
         'Development Status :: 4 - Beta',
         'Intended Audience :: Developers',